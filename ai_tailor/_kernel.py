@@ -0,0 +1,19 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, fastmath=True)
+def measure(xy, pairs, ratio):
+    """Distance between each pair of points in xy, scaled by ratio"""
+    out = np.empty(pairs.shape[0], np.float32)
+    for k in range(pairs.shape[0]):
+        a, b = pairs[k, 0], pairs[k, 1]
+        dx = xy[a, 0] - xy[b, 0]
+        dy = xy[a, 1] - xy[b, 1]
+        out[k] = np.sqrt(dx * dx + dy * dy) * ratio
+    return out
+
+
+def warmup():
+    """Compile measure ahead of the first frame"""
+    measure(np.zeros((2, 2), np.float32), np.zeros((1, 2), np.intp), 1.0)
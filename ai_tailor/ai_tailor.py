@@ -1,158 +1,335 @@
+import atexit
 import cv2
+import gzip
 import mediapipe as mp
 import numpy as np
-import json
+import orjson
 import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify
 import threading
+import types
+import _kernel
 
 app = Flask(__name__)
 
+# MediaPipe pose landmark indices
+_LM = types.SimpleNamespace(
+    NOSE=0, L_EAR=7, R_EAR=8,
+    L_SHOULDER=11, R_SHOULDER=12, L_ELBOW=13, R_ELBOW=14, L_WRIST=15, R_WRIST=16,
+    L_HIP=23, R_HIP=24, L_KNEE=25, R_KNEE=26, L_ANKLE=27, R_ANKLE=28
+)
+
+_MEASUREMENT_PAIRS = (
+    ('Shoulder Width', _LM.L_SHOULDER, _LM.R_SHOULDER),
+    ('Left Arm Length', _LM.L_SHOULDER, _LM.L_WRIST),
+    ('Torso Length', _LM.L_SHOULDER, _LM.L_HIP),
+    ('Inseam', _LM.L_HIP, _LM.L_ANKLE),
+    ('Hip Width', _LM.L_HIP, _LM.R_HIP),
+    ('Leg Length', _LM.L_HIP, _LM.L_ANKLE),
+)
+
+# Landmarks read per frame, and each measurement's endpoints as rows into them
+_NEEDED = tuple(sorted({i for _, a, b in _MEASUREMENT_PAIRS for i in (a, b)}))
+_PAIRS = np.array([(_NEEDED.index(a), _NEEDED.index(b)) for _, a, b in _MEASUREMENT_PAIRS],
+                  dtype=np.intp)
+
+# Requested capture resolution
+_FRAME_WIDTH = 1280
+_FRAME_HEIGHT = 720
+# Frames wider than this are downscaled (keeping aspect) before inference
+_INFERENCE_WIDTH = 640
+# Mean absolute difference (per 32x32 thumbnail pixel) below which a frame
+# is considered unchanged and pose inference is skipped
+_FRAME_DELTA_THRESHOLD = 2.0
+# Number of recent detections median-filtered into each measurement
+_MEDIAN_WINDOW = 10
+# Landmark visibility required for a measurement endpoint to count
+_MIN_VISIBILITY = 0.5
+# Longest /calibrate waits for the inference worker before giving up
+_CALIBRATE_TIMEOUT_S = 5.0
+# Each open /video_feed holds a server thread; keep some free for the API.
+# _SERVER_THREADS is applied by __main__, which the Procfile also runs
+_MAX_STREAMS = 2
+_SERVER_THREADS = 4
+
 class AITailorSystem:
     def __init__(self):
-        # Initialize MediaPipe Pose
+        # Initialize MediaPipe Pose, preferring the Tasks landmarker (GPU, then
+        # CPU) and falling back to the legacy solution if no model is available
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=1,
-            smooth_landmarks=True,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7
-        )
+        self.pose = None
+        self._last_timestamp_ms = 0
+        self.landmarker = self._create_landmarker()
+        if self.landmarker is None:
+            self.pose = self.mp_pose.Pose(
+                static_image_mode=False,
+                model_complexity=0,
+                smooth_landmarks=False,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.7
+            )
         self.mp_drawing = mp.solutions.drawing_utils
+        _kernel.warmup()
         
         # Camera and display settings
-        self.cap = None
         self.calibration_distance = 50
         self.pixel_to_cm_ratio = 0
-        self.calibrated = False
-        self.measurements_data = {}
         self.current_user = "Guest"
         self.current_measurements = None
+        self._rgb_buf = None
+        self._last_sig = None
+        # Rebound to _process_calibrated once calibrate_system succeeds
+        self.process_frame = self._process_uncalibrated
+        
+        # Normalized landmark positions of the last few detections, stored
+        # as (frame, landmark, xy) so the median is taken per coordinate
+        self._landmark_buf = np.empty((_MEDIAN_WINDOW, len(_NEEDED), 2), dtype=np.float32)
+        self._landmark_count = 0
+        
+        # Capture/inference pipeline: the capture thread keeps only the most
+        # recent frame and hands it to a single inference worker, which owns
+        # the pose model and publishes into a 1-slot queue
+        self.cap = cv2.VideoCapture(0)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, _FRAME_WIDTH)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, _FRAME_HEIGHT)
+        self.cap_lock = threading.Lock()
+        self.new_frame = threading.Condition()
+        self.frame_id = 0
+        self.running = threading.Event()
+        self.latest_frame = None
+        self.results_queue = queue.Queue(maxsize=1)
+        self._infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pose')
+        self._infer_future = None
+        
+        self.running.set()
+        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread.start()
+        atexit.register(self.close)
+    
+    def close(self):
+        """Stop the pipeline threads and release the camera"""
+        self.running.clear()
+        if self.capture_thread.is_alive():
+            self.capture_thread.join(timeout=1.0)
+        # A capture thread stuck in cap.read() may still submit a frame, so
+        # only shut the pool down once it has exited
+        if not self.capture_thread.is_alive():
+            self._infer_pool.shutdown(wait=True, cancel_futures=True)
+        with self.cap_lock:
+            self.cap.release()
+    
+    def _create_landmarker(self):
+        """Create a Tasks PoseLandmarker, trying the GPU delegate before CPU"""
+        model_path = os.environ.get('POSE_MODEL_PATH', 'pose_landmarker_lite.task')
+        if not os.path.exists(model_path):
+            return None
         
-    def calibrate_system(self, frame):
+        vision = mp.tasks.vision
+        delegates = (mp.tasks.BaseOptions.Delegate.GPU, mp.tasks.BaseOptions.Delegate.CPU)
+        for delegate in delegates:
+            try:
+                options = vision.PoseLandmarkerOptions(
+                    base_options=mp.tasks.BaseOptions(model_asset_path=model_path, delegate=delegate),
+                    running_mode=vision.RunningMode.VIDEO,
+                    min_pose_detection_confidence=0.5,
+                    min_tracking_confidence=0.7
+                )
+                return vision.PoseLandmarker.create_from_options(options)
+            except Exception as e:
+                print(f"Pose landmarker unavailable on {delegate.name}: {e}")
+        return None
+    
+    def _capture_loop(self):
+        """Continuously decode camera frames into the latest-frame slot"""
+        while self.running.is_set():
+            with self.cap_lock:
+                ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.1)
+                continue
+            with self.new_frame:
+                self.latest_frame = frame
+                self.frame_id += 1
+                self.new_frame.notify_all()
+            
+            if not self.running.is_set():
+                break
+            # At most one frame in flight; frames arriving while the worker is
+            # busy are dropped in favour of newer ones
+            if self._infer_future is None or self._infer_future.done():
+                try:
+                    self._infer_future = self._infer_pool.submit(self._infer, frame)
+                except RuntimeError:
+                    # concurrent.futures refuses new work once the
+                    # interpreter starts shutting down, before close() runs
+                    break
+    
+    def _infer(self, frame):
+        """Run pose inference on a frame and publish the result"""
+        try:
+            success, measurements = self.process_frame(frame)
+        except Exception as e:
+            print(f"Inference error: {e}")
+            return
+        self._publish(measurements if success else None)
+    
+    def _publish(self, measurements):
+        """Replace the queued result with a newer one (drop-old)"""
+        self.current_measurements = measurements
+        try:
+            self.results_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.results_queue.put_nowait(measurements)
+    
+    def capture_width(self):
+        """Return the camera's actual frame width in pixels (0 if unavailable)"""
+        with self.cap_lock:
+            return int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    
+    def wait_for_frame(self, last_id, timeout=1.0):
+        """Block until a frame newer than last_id arrives; return (id, frame)"""
+        with self.new_frame:
+            self.new_frame.wait_for(lambda: self.frame_id != last_id, timeout=timeout)
+            return self.frame_id, self.latest_frame
+    
+    def latest_measurements(self):
+        """Return the most recently inferred measurements, or None"""
+        try:
+            return self.results_queue.get_nowait()
+        except queue.Empty:
+            return self.current_measurements
+    
+    def recalibrate(self, frame_width):
+        """Calibrate on the inference worker, which owns the per-frame state"""
+        future = self._infer_pool.submit(self.calibrate_system, frame_width)
+        try:
+            return future.result(timeout=_CALIBRATE_TIMEOUT_S)
+        except FutureTimeoutError:
+            future.cancel()
+            return False
+    
+    def calibrate_system(self, frame_width):
         """Calibrate using face width"""
-        h, w, _ = frame.shape
-        face_width_pixels = w / 8
+        face_width_pixels = frame_width / 8
         average_face_width_cm = 15.5
         self.pixel_to_cm_ratio = average_face_width_cm / face_width_pixels
-        self.calibrated = True
+        self._last_sig = None
+        self.process_frame = self._process_calibrated
         return True
     
-    def calculate_distance(self, point1, point2):
-        """Calculate Euclidean distance between two points"""
-        return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
-    
     def extract_measurements(self, landmarks, frame_shape):
         """Extract body measurements from pose landmarks"""
         h, w, _ = frame_shape
         
-        landmarks_dict = {
-            'nose': 0,
-            'left_shoulder': 11,
-            'right_shoulder': 12,
-            'left_elbow': 13,
-            'right_elbow': 14,
-            'left_wrist': 15,
-            'right_wrist': 16,
-            'left_hip': 23,
-            'right_hip': 24,
-            'left_knee': 25,
-            'right_knee': 26,
-            'left_ankle': 27,
-            'right_ankle': 28,
-            'left_ear': 7,
-            'right_ear': 8
-        }
-        
-        measurements = {}
-        
         if self.pixel_to_cm_ratio == 0:
             return None
         
-        try:
-            # Shoulder width
-            left_shoulder = [landmarks[landmarks_dict['left_shoulder']].x * w, 
-                           landmarks[landmarks_dict['left_shoulder']].y * h]
-            right_shoulder = [landmarks[landmarks_dict['right_shoulder']].x * w, 
-                            landmarks[landmarks_dict['right_shoulder']].y * h]
-            shoulder_width = self.calculate_distance(left_shoulder, right_shoulder)
-            measurements['Shoulder Width'] = round(shoulder_width * self.pixel_to_cm_ratio, 1)
-            
-            # Arm length
-            left_shoulder_pos = [landmarks[landmarks_dict['left_shoulder']].x * w,
-                               landmarks[landmarks_dict['left_shoulder']].y * h]
-            left_wrist_pos = [landmarks[landmarks_dict['left_wrist']].x * w,
-                            landmarks[landmarks_dict['left_wrist']].y * h]
-            arm_length = self.calculate_distance(left_shoulder_pos, left_wrist_pos)
-            measurements['Left Arm Length'] = round(arm_length * self.pixel_to_cm_ratio, 1)
-            
-            # Torso length
-            left_hip = [landmarks[landmarks_dict['left_hip']].x * w,
-                       landmarks[landmarks_dict['left_hip']].y * h]
-            torso_length = self.calculate_distance(left_shoulder_pos, left_hip)
-            measurements['Torso Length'] = round(torso_length * self.pixel_to_cm_ratio, 1)
-            
-            # Inseam
-            left_ankle = [landmarks[landmarks_dict['left_ankle']].x * w,
-                         landmarks[landmarks_dict['left_ankle']].y * h]
-            inseam = self.calculate_distance(left_hip, left_ankle)
-            measurements['Inseam'] = round(inseam * self.pixel_to_cm_ratio, 1)
-            
-            # Hip width
-            right_hip = [landmarks[landmarks_dict['right_hip']].x * w,
-                        landmarks[landmarks_dict['right_hip']].y * h]
-            hip_width = self.calculate_distance(left_hip, right_hip)
-            measurements['Hip Width'] = round(hip_width * self.pixel_to_cm_ratio, 1)
-            
-            # Leg length
-            leg_length = self.calculate_distance(left_hip, left_ankle)
-            measurements['Leg Length'] = round(leg_length * self.pixel_to_cm_ratio, 1)
-            
-            return measurements
-        
-        except Exception as e:
-            print(f"Error calculating measurements: {e}")
-            return None
+        packed = np.fromiter(
+            (v for lm in (landmarks[i] for i in _NEEDED) for v in (lm.x, lm.y, lm.visibility)),
+            dtype=np.float32,
+            count=len(_NEEDED) * 3
+        ).reshape(-1, 3)
+        
+        slot = self._landmark_count % _MEDIAN_WINDOW
+        self._landmark_buf[slot] = packed[:, :2]
+        self._landmark_count += 1
+        
+        # Median over the filled slots smooths per-frame landmark jitter
+        n = min(self._landmark_count, _MEDIAN_WINDOW)
+        med = np.median(self._landmark_buf[:n], axis=0).astype(np.float32)
+        pts = med * np.array([w, h], dtype=np.float32)
+        
+        # Measurements with an endpoint not visible in this frame become NaN
+        vis = packed[:, 2]
+        valid = (vis[_PAIRS[:, 0]] >= _MIN_VISIBILITY) & (vis[_PAIRS[:, 1]] >= _MIN_VISIBILITY)
+        dists = _kernel.measure(pts, _PAIRS, self.pixel_to_cm_ratio)
+        dists = np.where(valid, np.round(dists.astype(np.float64), 1), np.nan).tolist()
+        
+        # NaN is not valid JSON, so missing measurements are reported as null
+        return {name: None if d != d else d for (name, _, _), d in zip(_MEASUREMENT_PAIRS, dists)}
     
-    def process_frame(self, frame):
-        """Process frame and return measurements"""
-        if not self.calibrated:
-            self.calibrate_system(frame)
+    def _detect(self, rgb_frame):
+        """Run pose inference and return the landmark sequence, or None"""
+        if self.landmarker is not None:
+            # VIDEO mode requires strictly increasing timestamps
+            timestamp_ms = max(int(time.monotonic() * 1000), self._last_timestamp_ms + 1)
+            self._last_timestamp_ms = timestamp_ms
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+            result = self.landmarker.detect_for_video(image, timestamp_ms)
+            return result.pose_landmarks[0] if result.pose_landmarks else None
         
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         results = self.pose.process(rgb_frame)
-        
-        if results.pose_landmarks:
-            measurements = self.extract_measurements(results.pose_landmarks, frame.shape)
+        return results.pose_landmarks.landmark if results.pose_landmarks else None
+    
+    def _process_uncalibrated(self, frame):
+        """Calibrate from the first frame, then process it"""
+        self.calibrate_system(frame.shape[1])
+        return self._process_calibrated(frame)
+    
+    def _process_calibrated(self, frame):
+        """Process frame and return measurements"""
+        # Skip inference when the frame is effectively identical to the last one
+        sig = cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA)
+        if self._last_sig is not None and cv2.absdiff(sig, self._last_sig).mean() < _FRAME_DELTA_THRESHOLD:
+            return self.current_measurements is not None, self.current_measurements
+        self._last_sig = sig
+        
+        # Downscale before color conversion; landmarks are normalized, so
+        # measurements still use the full frame's shape
+        h, w, _ = frame.shape
+        small = frame
+        if w > _INFERENCE_WIDTH:
+            size = (_INFERENCE_WIDTH, round(h * _INFERENCE_WIDTH / w))
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        
+        # Reuse one RGB buffer across frames instead of allocating per call
+        if self._rgb_buf is None or self._rgb_buf.shape != small.shape:
+            self._rgb_buf = np.empty_like(small)
+        self._rgb_buf.flags.writeable = True
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+        self._rgb_buf.flags.writeable = False
+        landmarks = self._detect(self._rgb_buf)
+        
+        if landmarks:
+            measurements = self.extract_measurements(landmarks, frame.shape)
             self.current_measurements = measurements
             return True, measurements
         
+        # Body lost: don't let old detections bleed into the next one
+        self._landmark_count = 0
         return False, None
     
     def save_measurements(self, user_name, measurements):
-        """Save measurements to JSON"""
+        """Append measurements to the user's JSON Lines file"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        if user_name not in self.measurements_data:
-            self.measurements_data[user_name] = []
-        
         measurement_record = {
             'timestamp': timestamp,
             'measurements': measurements
         }
         
-        self.measurements_data[user_name].append(measurement_record)
-        
-        filename = f"measurements_{user_name}.json"
+        filename = f"measurements_{user_name}.jsonl"
         try:
-            with open(filename, 'w') as f:
-                json.dump(self.measurements_data[user_name], f, indent=4)
+            with open(filename, 'ab', buffering=1 << 15) as f:
+                f.write(orjson.dumps(measurement_record, option=orjson.OPT_APPEND_NEWLINE))
         except Exception as e:
             print(f"Error saving file: {e}")
         
         return True
+    
+    def load_measurements(self, user_name):
+        """Load all saved measurement records for a user"""
+        filename = f"measurements_{user_name}.jsonl"
+        if not os.path.exists(filename):
+            return []
+        with open(filename, 'rb') as f:
+            return [orjson.loads(line) for line in f if line.strip()]
 
 tailor_system = AITailorSystem()
 
@@ -227,7 +404,7 @@ HTML_TEMPLATE = '''
             align-items: center;
         }
         
-        video {
+        .video-container img {
             width: 100%;
             height: 100%;
             object-fit: cover;
@@ -414,7 +591,7 @@ HTML_TEMPLATE = '''
         <div id="alert"></div>
         
         <div class="video-container">
-            <video id="video" playsinline autoplay></video>
+            <img id="video" src="/video_feed" alt="Camera feed">
         </div>
         
         <div class="status-box">
@@ -451,16 +628,8 @@ HTML_TEMPLATE = '''
         let calibrated = false;
         let currentMeasurements = null;
         
-        navigator.mediaDevices.getUserMedia({ 
-            video: { facingMode: 'user', width: { ideal: 1280 }, height: { ideal: 720 } } 
-        })
-        .then(stream => {
-            video.srcObject = stream;
-            showAlert('Camera started! Click "Calibrate System" to begin.', 'info');
-        })
-        .catch(err => {
-            showAlert('Error accessing camera: ' + err.message, 'error');
-        });
+        video.onerror = () => showAlert('Error accessing camera feed.', 'error');
+        showAlert('Camera started! Click "Calibrate System" to begin.', 'info');
         
         function calibrate() {
             fetch('/calibrate')
@@ -505,7 +674,7 @@ HTML_TEMPLATE = '''
                 item.className = 'measurement-item';
                 item.innerHTML = `
                     <span class="measurement-name">${key}</span>
-                    <span class="measurement-value">${value} cm</span>
+                    <span class="measurement-value">${value === null ? '—' : value + ' cm'}</span>
                 `;
                 list.appendChild(item);
             }
@@ -534,9 +703,8 @@ HTML_TEMPLATE = '''
         }
         
         function stopCamera() {
-            const stream = video.srcObject;
-            const tracks = stream.getTracks();
-            tracks.forEach(track => track.stop());
+            video.onerror = null;
+            video.removeAttribute('src');
             showAlert('Camera stopped.', 'info');
         }
         
@@ -555,20 +723,60 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# The template has no dynamic content, so render, encode and compress it once
+with app.app_context():
+    _HTML_BYTES = render_template_string(HTML_TEMPLATE).encode('utf-8')
+_HTML_GZ = gzip.compress(_HTML_BYTES, 6)
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    if 'gzip' in request.accept_encodings:
+        response = Response(_HTML_GZ, mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(_HTML_BYTES, mimetype='text/html')
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def _mjpeg_part(frame):
+    """Encode a frame as one multipart JPEG part, or None on failure"""
+    ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    if not ok:
+        return None
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n'
+
+# Sent until the camera delivers its first frame
+_PLACEHOLDER_PART = _mjpeg_part(np.zeros((_FRAME_HEIGHT, _FRAME_WIDTH, 3), dtype=np.uint8))
+
+def _mjpeg_frames():
+    """Yield each new camera frame as a multipart JPEG part"""
+    frame_id = 0
+    part = _PLACEHOLDER_PART
+    while tailor_system.running.is_set():
+        new_id, frame = tailor_system.wait_for_frame(frame_id)
+        if new_id != frame_id:
+            frame_id = new_id
+            part = _mjpeg_part(frame) or part
+        # Re-send the last part when no new frame arrived so a disconnected
+        # client is still detected and its stream slot released
+        yield part
+
+_stream_slots = threading.BoundedSemaphore(_MAX_STREAMS)
+
+@app.route('/video_feed')
+def video_feed():
+    if not _stream_slots.acquire(blocking=False):
+        return Response('Too many open video streams', status=503)
+    response = Response(_mjpeg_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(_stream_slots.release)
+    return response
 
 @app.route('/calibrate')
 def calibrate():
     try:
-        cap = cv2.VideoCapture(0)
-        ret, frame = cap.read()
-        if ret:
-            tailor_system.calibrate_system(frame)
-            cap.release()
+        width = tailor_system.capture_width()
+        if width > 0 and tailor_system.recalibrate(width):
             return jsonify({'success': True, 'message': 'Calibrated'})
-        cap.release()
     except Exception as e:
         print(f"Calibration error: {e}")
     return jsonify({'success': False})
@@ -576,14 +784,9 @@ def calibrate():
 @app.route('/measure')
 def measure():
     try:
-        cap = cv2.VideoCapture(0)
-        ret, frame = cap.read()
-        if ret:
-            success, measurements = tailor_system.process_frame(frame)
-            cap.release()
-            if success and measurements:
-                return jsonify({'success': True, 'measurements': measurements})
-        cap.release()
+        measurements = tailor_system.latest_measurements()
+        if measurements:
+            return jsonify({'success': True, 'measurements': measurements})
     except Exception as e:
         print(f"Measurement error: {e}")
     return jsonify({'success': False})
@@ -601,5 +804,7 @@ def save():
 if __name__ == '__main__':
     port = os.environ.get('PORT', 5000)
     print(f"🚀 AI Tailor System Starting on port {port}...")
-    app.run(debug=False, host='0.0.0.0', port=int(port))
+    from waitress import serve
+    # At most _MAX_STREAMS threads are tied up by /video_feed viewers
+    serve(app, host='0.0.0.0', port=int(port), threads=_SERVER_THREADS)
 
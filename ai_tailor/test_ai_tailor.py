@@ -0,0 +1,76 @@
+import os
+import tempfile
+import types
+import unittest
+
+import numpy as np
+
+from ai_tailor import AITailorSystem, _LM, _MEDIAN_WINDOW, _NEEDED
+
+
+def fake_landmarks(overrides, visibility=1.0):
+    """33 pose landmarks at the origin, with some moved to (x, y)"""
+    landmarks = [types.SimpleNamespace(x=0.0, y=0.0, visibility=visibility) for _ in range(33)]
+    for index, (x, y) in overrides.items():
+        landmarks[index] = types.SimpleNamespace(x=x, y=y, visibility=visibility)
+    return landmarks
+
+
+class ExtractMeasurementsTest(unittest.TestCase):
+    def setUp(self):
+        # Importing ai_tailor already starts the shared tailor_system (camera,
+        # pose model, capture thread); use a bare instance so the test owns
+        # its calibration and landmark state
+        self.system = object.__new__(AITailorSystem)
+        self.system.pixel_to_cm_ratio = 0
+        self.system._landmark_buf = np.empty(
+            (_MEDIAN_WINDOW, len(_NEEDED), 2), dtype=np.float32)
+        self.system._landmark_count = 0
+        self.system.calibrate_system(640)
+
+    def test_distances_use_calibrated_ratio(self):
+        landmarks = fake_landmarks({
+            _LM.L_SHOULDER: (0.4, 0.3), _LM.R_SHOULDER: (0.6, 0.3),
+            _LM.L_HIP: (0.4, 0.6), _LM.R_HIP: (0.6, 0.6),
+        })
+        measurements = self.system.extract_measurements(landmarks, (480, 640, 3))
+        # 0.2 * 640 px * (15.5 cm / 80 px)
+        self.assertAlmostEqual(measurements['Shoulder Width'], 24.8)
+        self.assertAlmostEqual(measurements['Hip Width'], 24.8)
+
+    def test_low_visibility_endpoint_is_none(self):
+        landmarks = fake_landmarks({
+            _LM.L_SHOULDER: (0.4, 0.3), _LM.R_SHOULDER: (0.6, 0.3),
+            _LM.L_HIP: (0.4, 0.6), _LM.R_HIP: (0.6, 0.6),
+        })
+        landmarks[_LM.R_SHOULDER].visibility = 0.1
+        measurements = self.system.extract_measurements(landmarks, (480, 640, 3))
+        self.assertIsNone(measurements['Shoulder Width'])
+        self.assertAlmostEqual(measurements['Hip Width'], 24.8)
+
+
+
+class SaveMeasurementsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp.name)
+        self.system = object.__new__(AITailorSystem)
+
+    def test_save_then_load_round_trip(self):
+        first = {'Shoulder Width': 40.1, 'Hip Width': None}
+        second = {'Shoulder Width': 40.3, 'Hip Width': 35.0}
+        self.system.save_measurements('Alice', first)
+        self.system.save_measurements('Alice', second)
+
+        records = self.system.load_measurements('Alice')
+        self.assertEqual([r['measurements'] for r in records], [first, second])
+        self.assertTrue(all('timestamp' in r for r in records))
+
+    def test_load_unknown_user_is_empty(self):
+        self.assertEqual(self.system.load_measurements('Nobody'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()